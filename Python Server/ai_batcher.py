@@ -0,0 +1,160 @@
+"""
+AiCell AI micro-batching
+Questions that miss the predefined replies and the knowledge base are
+queued here. A lone question is dispatched almost immediately; during a
+burst they are gathered for a short window and answered with one batched
+AI request (or fanned out in parallel under a concurrency limit), then the
+answers are split back to the waiting senders.
+
+The dispatcher resolves every question itself: one that has waited
+longer than max_wait for a free backend slot is answered None (the
+caller's fallback) instead of starting a call nobody can use in time.
+
+Note: a batch puts several subscribers' messages into one prompt, so one
+sender's prompt injection ("ignore the other questions and ...") can
+change the answers other senders get. ask_batch should tell the model to
+treat each question independently; set max_batch to 1 to turn batching
+off where that risk matters.
+"""
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+
+
+class AIBatcher:
+    def __init__(self, ask_one, ask_batch=None, window=0.5, idle_gap=0.05,
+                 max_batch=8, max_concurrency=4, request_timeout=20, max_wait=60):
+        # ask_one(message, profile) -> str | None
+        # ask_batch([(message, profile), ...]) -> [str | None, ...] | None
+        self.ask_one = ask_one
+        self.ask_batch = ask_batch
+        self.window = window          # longest a question waits for company
+        self.idle_gap = idle_gap      # no 2nd question this soon -> go alone
+        self.max_batch = max_batch    # 1 = never batch
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout  # backend timeout per call
+        self.max_wait = max_wait      # no new call for a question older than this
+
+        self._queue = queue.Queue()
+        # Every backend call holds the semaphore, batched or not
+        self._slots = threading.Semaphore(max_concurrency)
+        self._dispatchers = ThreadPoolExecutor(max_workers=max_concurrency,
+                                               thread_name_prefix='aicell-batch')
+        self._requests = ThreadPoolExecutor(max_workers=max_concurrency,
+                                            thread_name_prefix='aicell-ai')
+        self.stats = {'questions': 0, 'batches': 0, 'batched_questions': 0, 'expired': 0}
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, message, profile=None):
+        """Block until the AI answer for this message is ready (None on failure)"""
+        future = Future()
+        self._queue.put((message, profile, future, time.monotonic()))
+        # The dispatcher resolves every question within max_wait + one call;
+        # this timeout only guards against a stuck dispatcher
+        try:
+            return future.result(timeout=self.max_wait + self.request_timeout + 5)
+        except Exception as e:
+            future.cancel()  # not started yet: the dispatcher skips it
+            logging.warning(f"AI request failed: {e}")
+            return None
+
+    def set_concurrency(self, max_concurrency):
+        """Resize the backend call limit (calls in flight finish on the old one)"""
+        old = (self._dispatchers, self._requests)
+        self.max_concurrency = max_concurrency
+        self._slots = threading.Semaphore(max_concurrency)
+        self._dispatchers = ThreadPoolExecutor(max_workers=max_concurrency,
+                                               thread_name_prefix='aicell-batch')
+        self._requests = ThreadPoolExecutor(max_workers=max_concurrency,
+                                            thread_name_prefix='aicell-ai')
+        for pool in old:
+            pool.shutdown(wait=False)
+
+    # ---------------------------------------------------------- batching
+    def _collect(self):
+        batch = [self._queue.get()]
+        if self.max_batch <= 1 or not self.ask_batch:
+            return batch
+        try:
+            batch.append(self._queue.get(timeout=self.idle_gap))
+        except queue.Empty:
+            return batch
+
+        # A burst is under way: keep gathering until the window closes
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            self.stats['questions'] += len(batch)
+            # Dispatch in the pool so the next batch can form meanwhile
+            self._dispatchers.submit(self._dispatch, batch)
+
+    def _expired(self, item):
+        return time.monotonic() - item[3] > self.max_wait
+
+    def _dispatch(self, batch):
+        answers = {}
+        try:
+            live = [item for item in batch if not item[2].cancelled()]
+            if len(live) > 1:
+                answers = self._ask_batch_safe(live)
+
+            # Anything the batch call couldn't answer goes out individually;
+            # the semaphore caps how many run at once.
+            missing = [item for item in live if not answers.get(id(item))]
+            if len(missing) == 1:
+                answers[id(missing[0])] = self._ask_one_safe(missing[0])
+            elif missing:
+                for item, answer in zip(missing, self._requests.map(self._ask_one_safe, missing)):
+                    answers[id(item)] = answer
+        finally:
+            # Every waiting sender gets a result, even if something above broke
+            for item in batch:
+                try:
+                    item[2].set_result(answers.get(id(item)))
+                except InvalidStateError:
+                    pass  # the sender gave up and cancelled
+
+    def _ask_batch_safe(self, items):
+        """{id(item): answer} from one batched call, {} when it can't be used"""
+        with self._slots:
+            if any(self._expired(item) for item in items):
+                return {}  # the one-by-one path drops whoever is out of time
+            try:
+                answers = self.ask_batch([(message, profile) for message, profile, _, _ in items])
+            except Exception as e:
+                logging.warning(f"Batched AI request failed: {e}")
+                return {}
+        if answers is None or len(answers) != len(items):
+            return {}
+        self.stats['batches'] += 1
+        self.stats['batched_questions'] += len(items)
+        return {id(item): answer for item, answer in zip(items, answers)}
+
+    def _ask_one_safe(self, item):
+        message, profile, future, _ = item
+        with self._slots:
+            # Waiting for a slot can take a while in a burst; don't start a
+            # call nobody is waiting for or that would finish too late
+            if future.cancelled():
+                return None
+            if self._expired(item):
+                self.stats['expired'] += 1
+                return None
+            try:
+                return self.ask_one(message, profile)
+            except Exception as e:
+                logging.warning(f"AI request failed: {e}")
+                return None
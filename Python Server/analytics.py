@@ -0,0 +1,246 @@
+"""
+AiCell message analytics
+Every handled SMS is appended to history/YYYY-MM-DD.jsonl. A background
+job compacts each day into a columnar NumPy file (history/YYYY-MM-DD.npz,
+strings dictionary-encoded) and computes rollups from the arrays:
+top intents, answer sources / cache hit rate, response-time percentiles,
+hourly volume and per-operator delivery success. /stats serves those
+rollups, so dashboards never scan the raw logs.
+"""
+import json
+import logging
+import os
+import threading
+import time
+
+import numpy as np
+
+from phone_numbers import get_operator
+
+HISTORY_DIR = 'history'
+
+# Answer sources that never touched the AI backend
+CACHE_SOURCES = ('predefined', 'knowledge')
+
+# Opt-out / opt-in / rate limit: outcomes, not something the sender asked
+CONTROL_SOURCES = ('opt_out', 'opted_out', 'opt_in', 'rate_limited')
+
+
+# ==================================================================
+# =========================== RAW LOG ==============================
+# ==================================================================
+
+class MessageLog:
+    """Append-only JSON-lines history, one file per day"""
+
+    def __init__(self, history_dir=HISTORY_DIR):
+        self.history_dir = history_dir
+        os.makedirs(history_dir, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def _append(self, event):
+        day = time.strftime('%Y-%m-%d', time.localtime(event['ts']))
+        line = json.dumps(event, ensure_ascii=False) + '\n'
+        with self._lock:
+            with open(os.path.join(self.history_dir, day + '.jsonl'), 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def record_inbound(self, sender, source, intent=None, language=None, build_ms=None):
+        """A received SMS and how its reply was produced"""
+        try:
+            self._append({
+                'kind': 'in', 'ts': time.time(), 'sender': sender,
+                'operator': get_operator(sender) or 'other',
+                'source': source, 'intent': intent or '',
+                'language': language or '', 'build_ms': build_ms,
+            })
+        except Exception as e:
+            logging.warning(f"History write failed: {e}")
+
+    def record_outbound(self, number, delivered, latency_ms=None):
+        """A reply handed to the modem, and whether it was accepted"""
+        try:
+            self._append({
+                'kind': 'out', 'ts': time.time(), 'sender': number,
+                'operator': get_operator(number) or 'other',
+                'delivered': bool(delivered), 'latency_ms': latency_ms,
+            })
+        except Exception as e:
+            logging.warning(f"History write failed: {e}")
+
+
+# ==================================================================
+# =========================== COLUMNAR =============================
+# ==================================================================
+
+def _encode(values):
+    """Dictionary-encode strings: (codes uint16, categories)"""
+    categories, codes = np.unique(np.asarray(values, dtype=object).astype(str),
+                                  return_inverse=True)
+    return codes.astype(np.uint16), categories
+
+
+def _floats(values):
+    return np.array([np.nan if v is None else v for v in values], dtype=np.float32)
+
+
+def compact_day(jsonl_path, npz_path):
+    """Convert one day's raw events into a columnar .npz file"""
+    inbound, outbound = [], []
+    with open(jsonl_path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue  # a torn last line while the server is writing
+            (inbound if event.get('kind') == 'in' else outbound).append(event)
+
+    cols = {}
+    cols['in_ts'] = np.array([e['ts'] for e in inbound], dtype=np.float64)
+    cols['in_build_ms'] = _floats([e.get('build_ms') for e in inbound])
+    for name in ('source', 'intent', 'language', 'operator'):
+        cols[f'in_{name}'], cols[f'in_{name}_values'] = _encode([e.get(name, '') for e in inbound])
+
+    cols['out_ts'] = np.array([e['ts'] for e in outbound], dtype=np.float64)
+    cols['out_delivered'] = np.array([e.get('delivered', False) for e in outbound], dtype=bool)
+    cols['out_latency_ms'] = _floats([e.get('latency_ms') for e in outbound])
+    cols['out_operator'], cols['out_operator_values'] = _encode([e.get('operator', '') for e in outbound])
+
+    tmp = npz_path + '.tmp.npz'
+    np.savez_compressed(tmp, **cols)
+    os.replace(tmp, npz_path)
+
+
+def load_day(npz_path):
+    with np.load(npz_path, allow_pickle=False) as data:
+        return {k: data[k] for k in data.files}
+
+
+def _counts(codes, categories, limit=None, skip=()):
+    if not len(codes):
+        return {}
+    counts = np.bincount(codes, minlength=len(categories))
+    counts[np.isin(categories, skip)] = 0
+    order = np.argsort(counts)[::-1]
+    if limit:
+        order = order[:limit]
+    return {str(categories[i]): int(counts[i]) for i in order if counts[i]}
+
+
+def _percentiles(values):
+    values = values[~np.isnan(values)]
+    if not len(values):
+        return None
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return {'p50': round(float(p50), 1), 'p90': round(float(p90), 1),
+            'p99': round(float(p99), 1), 'max': round(float(values.max()), 1)}
+
+
+def rollup(cols):
+    """Aggregate one or more days of columns (see compact_day)"""
+    in_source, sources = cols['in_source'], cols['in_source_values']
+    cache_codes = np.flatnonzero(np.isin(sources, CACHE_SOURCES))
+    answered = np.isin(sources[in_source], ('opted_out', 'rate_limited'), invert=True)
+    # Older history stored control outcomes as the intent
+    no_intent = ('',) + CONTROL_SOURCES
+
+    hours = (np.floor((cols['in_ts'] - time.timezone) / 3600) % 24).astype(np.int64)
+    by_hour = np.bincount(hours, minlength=24) if len(hours) else np.zeros(24, dtype=np.int64)
+
+    out_ops, op_names = cols['out_operator'], cols['out_operator_values']
+    delivery = {}
+    if len(out_ops):
+        sent = np.bincount(out_ops, minlength=len(op_names))
+        ok = np.bincount(out_ops, weights=cols['out_delivered'], minlength=len(op_names))
+        for i, name in enumerate(op_names):
+            if sent[i]:
+                delivery[str(name)] = {'sent': int(sent[i]),
+                                       'success_rate': round(float(ok[i] / sent[i]), 3)}
+
+    return {
+        'messages_in': int(len(in_source)),
+        'replies_out': int(len(out_ops)),
+        'top_intents': _counts(cols['in_intent'], cols['in_intent_values'], limit=10,
+                               skip=no_intent),
+        'sources': _counts(in_source, sources),
+        'languages': _counts(cols['in_language'], cols['in_language_values']),
+        'cache_hit_rate': round(float(np.isin(in_source[answered], cache_codes).mean()), 3)
+        if np.count_nonzero(answered) else None,
+        'build_ms': _percentiles(cols['in_build_ms']),
+        'response_ms': _percentiles(cols['out_latency_ms']),
+        'delivery_by_operator': delivery,
+        'messages_by_hour': by_hour.tolist(),
+    }
+
+
+def merge_days(days):
+    """Concatenate day columns, re-encoding strings to shared categories"""
+    merged = {}
+    for key in ('in_ts', 'in_build_ms', 'out_ts', 'out_delivered', 'out_latency_ms'):
+        merged[key] = np.concatenate([d[key] for d in days])
+    for key in ('in_source', 'in_intent', 'in_language', 'in_operator', 'out_operator'):
+        strings = np.concatenate([d[key + '_values'][d[key]] for d in days])
+        merged[key], merged[key + '_values'] = _encode(strings)
+    return merged
+
+
+# ==================================================================
+# =========================== JOB ==================================
+# ==================================================================
+
+class AnalyticsJob:
+    """Periodically compacts history and refreshes the /stats rollups"""
+
+    def __init__(self, history_dir=HISTORY_DIR, interval=300, window_days=30):
+        self.history_dir = history_dir
+        self.interval = interval
+        self.window_days = window_days
+        self.stats = {'generated': None, 'days': {}, 'overall': None}
+        self._day_cache = {}   # day -> (npz mtime, columns, rollup)
+        self._stop = threading.Event()
+
+    def start(self):
+        def run():
+            while True:
+                try:
+                    self.run_once()
+                except Exception as e:
+                    logging.warning(f"Analytics job failed: {e}")
+                if self._stop.wait(self.interval):
+                    return
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        if not os.path.isdir(self.history_dir):
+            return self.stats
+        days = sorted(name[:-6] for name in os.listdir(self.history_dir)
+                      if name.endswith('.jsonl'))[-self.window_days:]
+
+        for day in days:
+            raw = os.path.join(self.history_dir, day + '.jsonl')
+            npz = os.path.join(self.history_dir, day + '.npz')
+            # Only days with new raw events get re-compacted
+            if not os.path.exists(npz) or os.path.getmtime(npz) < os.path.getmtime(raw):
+                compact_day(raw, npz)
+            mtime = os.path.getmtime(npz)
+            cached = self._day_cache.get(day)
+            if not cached or cached[0] != mtime:
+                cols = load_day(npz)
+                self._day_cache[day] = (mtime, cols, rollup(cols))
+
+        for day in list(self._day_cache):
+            if day not in days:
+                del self._day_cache[day]
+
+        overall = None
+        if self._day_cache:
+            overall = rollup(merge_days([c[1] for c in self._day_cache.values()]))
+        self.stats = {
+            'generated': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'days': {day: c[2] for day, c in sorted(self._day_cache.items())},
+            'overall': overall,
+        }
+        return self.stats
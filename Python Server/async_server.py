@@ -0,0 +1,484 @@
+"""
+AiCell asyncio runtime (optional)
+Serial transport, AI calls, timers and the HTTP API share one event loop
+instead of a polling thread + one thread per SMS + Flask threads.
+
+    python AiCell_Main_Server.py --async
+    python async_server.py
+
+Stages are connected by bounded queues, so a burst of SMS waits in memory
+instead of spawning threads, and a slow sender holds back the workers:
+
+    serial reader -> inbound queue -> reply workers -> outbound queue -> sender
+
+SMS kept in modem storage (+CMTI, or received while the server was down)
+are listed with CMGL into the same inbound queue, and deleted once their
+reply has been sent.
+
+Blocking work (AI HTTP request, SQLite) runs in a small fixed thread pool;
+modem health checks and /health get their own, so an AI burst can't
+delay recovery.
+"""
+import asyncio
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from modem_supervisor import ModemSupervisor
+from phone_numbers import normalize_number
+from sms_parser import ends_sms_body, parse_incoming_sms, parse_stored_sms
+
+INBOUND_QUEUE_SIZE = 200
+OUTBOUND_QUEUE_SIZE = 200
+REPLY_WORKERS = 16       # conversations in flight at once
+AI_THREADS = 8           # threads for blocking AI / database calls (AI requests
+                         # themselves are batched and capped in ai_batcher)
+CONTROL_THREADS = 2      # modem health checks / recovery and /health, kept
+                         # apart so they never queue behind slow AI calls
+POLL_INTERVAL = 0.05     # only used where the loop can't watch the port fd
+SMS_BODY_WAIT = 1.0      # longest wait for the first body line after +CMT
+SMS_BODY_SETTLE = 0.3    # quiet time that ends a body with no line after it
+
+
+# ==================================================================
+# =========================== SERIAL ===============================
+# ==================================================================
+
+class AsyncModem:
+    """Line-oriented AT transport driven by the event loop"""
+
+    def __init__(self, ser, inbound, on_activity=None, on_stored=None):
+        self.ser = ser
+        self.inbound = inbound          # (sender, message, storage index or None)
+        self.on_activity = on_activity
+        self.on_stored = on_stored      # called for +CMTI (SMS put in storage)
+        self.loop = asyncio.get_running_loop()
+
+        self._buffer = ""
+        self._cmt = None         # [header, body lines] of an SMS still arriving
+        self._cmt_timer = None
+        self._held = deque()  # SMS parsed while the inbound queue was full
+        self._responses = asyncio.Queue()
+        self._cmd_lock = asyncio.Lock()
+        self._reading = False
+        self._poll_handle = None
+
+    # ------------------------------------------------------- reading
+    def attach(self, ser=None):
+        if ser is not None:
+            self.ser = ser
+        self.ser.timeout = 0  # never block the loop
+        self._reading = True
+        try:
+            self.loop.add_reader(self.ser.fileno(), self._on_readable)
+        except (NotImplementedError, AttributeError, ValueError):
+            # Windows COM ports / Proactor loop: fall back to light polling
+            self._poll_handle = self.loop.call_later(POLL_INTERVAL, self._poll)
+
+    def detach(self):
+        self._reading = False
+        if self._poll_handle:
+            self._poll_handle.cancel()
+            self._poll_handle = None
+        else:
+            try:
+                self.loop.remove_reader(self.ser.fileno())
+            except (NotImplementedError, AttributeError, ValueError):
+                pass
+
+    def _poll(self):
+        self._poll_handle = None
+        if not self._reading:
+            return
+        self._on_readable()
+        if self._reading:
+            self._poll_handle = self.loop.call_later(POLL_INTERVAL, self._poll)
+
+    def _on_readable(self):
+        try:
+            data = self.ser.read(self.ser.in_waiting or 1)
+        except Exception as e:
+            print(f"Serial read error: {e}")
+            return
+        if data:
+            self.feed(data.decode('utf-8', errors='ignore'))
+
+    def feed(self, text):
+        """Push modem output through the line parser"""
+        if self.on_activity:
+            self.on_activity()
+
+        self._buffer += text
+        while '\n' in self._buffer:
+            line, self._buffer = self._buffer.split('\n', 1)
+            self._on_line(line.strip())
+
+        # The CMGS prompt "> " is not newline-terminated
+        if self._buffer.strip() == '>':
+            self._buffer = ""
+            self._responses.put_nowait('>')
+
+    def _on_line(self, line):
+        if self._cmt is not None:
+            header, body = self._cmt
+            if not line and not body:
+                return  # blank line before the body
+            # Body runs until the next blank line or status line
+            if not ends_sms_body(line, body):
+                body.append(line)
+                self._arm_cmt_timer(SMS_BODY_SETTLE)
+                return
+            self._finish_cmt()
+
+        if not line:
+            return
+        print(f"RAW: {line}")
+        if line.startswith('+CMT:'):
+            self._cmt = [line, []]
+            self._arm_cmt_timer(SMS_BODY_WAIT)
+        elif line.startswith('+CMTI:'):
+            if self.on_stored:
+                self.on_stored()
+        else:
+            self._responses.put_nowait(line)
+
+    def _arm_cmt_timer(self, delay):
+        # The last SMS of a burst has no line after it to end the body
+        if self._cmt_timer:
+            self._cmt_timer.cancel()
+        self._cmt_timer = self.loop.call_later(delay, self._finish_cmt, True)
+
+    def _finish_cmt(self, quiet=False):
+        if self._cmt_timer:
+            self._cmt_timer.cancel()
+            self._cmt_timer = None
+        if self._cmt is None:
+            return
+        header, body = self._cmt
+        # Line went quiet: a last body line without a newline is still body,
+        # not the start of the next command reply
+        tail = self._buffer.strip()
+        if quiet and tail and tail != '>' and not ends_sms_body(tail, body):
+            body.append(tail)
+            self._buffer = ""
+        self._cmt = None
+        sender, msg, _ = parse_incoming_sms("\n".join([header] + body))
+        if sender and msg:
+            self.deliver((sender, msg, None))
+        else:
+            print("Failed to parse SMS")
+
+    def deliver(self, sms):
+        # The port can't be paused (command replies share it), so when the
+        # workers fall behind, parsed SMS wait here instead of in the queue.
+        if self._held or self.inbound.full():
+            if not self._held:
+                print("Inbound queue full - holding SMS until workers catch up")
+            self._held.append(sms)
+            return
+        self.inbound.put_nowait(sms)
+
+    def resume(self):
+        """Called by consumers after taking work off the inbound queue"""
+        while self._held and not self.inbound.full():
+            self.inbound.put_nowait(self._held.popleft())
+
+    # ------------------------------------------------------ commands
+    async def command(self, command, timeout=3, until=('OK', 'ERROR')):
+        """Send an AT command and collect lines up to a final result code"""
+        async with self._cmd_lock:
+            return await self._command(command, timeout, until)
+
+    async def _command(self, command, timeout, until):
+        while not self._responses.empty():
+            self._responses.get_nowait()
+
+        print(f"\n>>> AT COMMAND: {command}")
+        self.ser.write((command + "\r\n").encode())
+
+        lines = []
+        deadline = self.loop.time() + timeout
+        while True:
+            remaining = deadline - self.loop.time()
+            if remaining <= 0:
+                break
+            try:
+                line = await asyncio.wait_for(self._responses.get(), remaining)
+            except asyncio.TimeoutError:
+                break
+            print(f"<< {line}")
+            lines.append(line)
+            if any(line.startswith(u) for u in until):
+                break
+        return "\n".join(lines)
+
+    async def send_sms(self, phone_number, message):
+        async with self._cmd_lock:
+            await self._command("AT+CMGF=1", 2, ('OK', 'ERROR'))
+            prompt = await self._command(f'AT+CMGS="{phone_number}"', 5, ('>', 'ERROR'))
+            if '>' not in prompt:
+                # Cancel a half-open CMGS so the modem isn't left waiting
+                self.ser.write(bytes([27]))
+                print(f"SMS FAILED (no prompt):\n{prompt}")
+                return False
+
+            self.ser.write(message.encode('utf-8') + bytes([26]))  # CTRL+Z
+            lines = []
+            deadline = self.loop.time() + 60
+            while self.loop.time() < deadline:
+                try:
+                    line = await asyncio.wait_for(self._responses.get(), deadline - self.loop.time())
+                except asyncio.TimeoutError:
+                    break
+                lines.append(line)
+                if line.startswith('+CMGS:') or line.startswith('OK') or 'ERROR' in line:
+                    break
+            resp = "\n".join(lines)
+            return "+CMGS:" in resp or "OK" in resp
+
+
+# ==================================================================
+# =========================== RUNTIME ==============================
+# ==================================================================
+
+class AsyncRuntime:
+    def __init__(self, server):
+        self.server = server
+        self.inbound = asyncio.Queue(maxsize=INBOUND_QUEUE_SIZE)
+        self.outbound = asyncio.Queue(maxsize=OUTBOUND_QUEUE_SIZE)
+        self.pool = ThreadPoolExecutor(max_workers=AI_THREADS, thread_name_prefix='aicell-ai')
+        self.control_pool = ThreadPoolExecutor(max_workers=CONTROL_THREADS,
+                                               thread_name_prefix='aicell-ctl')
+        self.loop = asyncio.get_running_loop()
+        self.modem = None
+        self.supervisor = None
+        self.stored_in_flight = set()   # storage indexes queued or being answered
+        self._draining = None
+
+    # ---------------------------------------------------------- stages
+    async def reply_worker(self):
+        while True:
+            sender, msg, index = await self.inbound.get()
+            received = time.time()
+            self.modem.resume()
+            try:
+                print(f"FROM: {sender}")
+                print(f"MSG : {msg}")
+                try:
+                    reply = await self.loop.run_in_executor(
+                        self.pool, self.server.build_reply, sender, msg)
+                except Exception as e:
+                    print(f"Process error: {e}")
+                    # The sender deletes a stored SMS once the apology is
+                    # out, so a message that keeps failing isn't retried forever
+                    reply = "Sorry, try again."
+                if reply:
+                    await self.outbound.put((sender, reply, received, index))
+                elif index is not None:
+                    await self.delete_stored(index)  # handled, no reply needed
+            finally:
+                self.inbound.task_done()
+
+    async def sender(self):
+        while True:
+            number, message, received, index = await self.outbound.get()
+            ok = False
+            try:
+                to = normalize_number(number)
+                if not to:
+                    print(f"INVALID NUMBER: {number}")
+                    continue
+                print(f"\nSENDING SMS\nTO  : {to}\nMSG : {message}")
+                ok = await self.modem.send_sms(to, message)
+                if ok:
+                    print("SMS SENT SUCCESSFULLY!")
+                    logging.info(f"Sent to {to}: {message}")
+                else:
+                    print("SMS FAILED")
+                latency = round((time.time() - received) * 1000, 1) if received else None
+                self.server.message_log.record_outbound(to, ok, latency)
+            except Exception as e:
+                print(f"SMS SEND ERROR: {e}")
+            finally:
+                if index is not None:
+                    if ok:
+                        await self.delete_stored(index)
+                    else:
+                        self.stored_in_flight.discard(index)
+                self.outbound.task_done()
+
+    # -------------------------------------------------- stored SMS
+    def drain_soon(self):
+        """Schedule one CMGL pass (coalesces +CMTI bursts)"""
+        if self._draining is None or self._draining.done():
+            self._draining = asyncio.ensure_future(self.drain_stored())
+
+    async def drain_stored(self):
+        resp = await self.modem.command('AT+CMGL="ALL"', 15)
+        count = 0
+        for index, sender, msg in parse_stored_sms(resp):
+            if index in self.stored_in_flight:
+                continue
+            if not (sender and msg):
+                await self.modem.command(f"AT+CMGD={index}", 2)
+                continue
+            print(f"STORED SMS FROM: {sender}")
+            self.stored_in_flight.add(index)
+            self.modem.deliver((sender, msg, index))
+            count += 1
+        if count:
+            print(f"Answering {count} stored SMS")
+
+    async def delete_stored(self, index):
+        try:
+            await self.modem.command(f"AT+CMGD={index}", 2)
+        finally:
+            self.stored_in_flight.discard(index)
+
+    # ------------------------------------------------- health timer
+    def _command_from_thread(self, command, wait_time=3):
+        future = asyncio.run_coroutine_threadsafe(
+            self.modem.command(command, wait_time), self.loop)
+        return future.result()
+
+    def _reopen_from_thread(self):
+        asyncio.run_coroutine_threadsafe(self._detach(), self.loop).result()
+        # Stored SMS are drained by the loop, not by init_gsm's threads
+        ok = self.server.reopen_gsm(drain=False)
+        if ok:
+            # init_gsm may have set aside inbound bytes while probing
+            leftover = self.server.take_backlog()
+            self.loop.call_soon_threadsafe(self.modem.attach, self.server.gsm_serial)
+            if leftover:
+                self.loop.call_soon_threadsafe(self.modem.feed, leftover)
+            self.loop.call_soon_threadsafe(self.drain_soon)
+        return ok
+
+    async def _detach(self):
+        self.modem.detach()
+
+    async def supervise(self):
+        # The timer lives on the loop; the check itself blocks on modem
+        # replies, so it runs in the pool and calls back into the loop.
+        sup = self.supervisor
+        while True:
+            await asyncio.sleep(sup._next_delay())
+            try:
+                healthy = await self.loop.run_in_executor(self.control_pool, sup.check)
+                if not healthy:
+                    await self.loop.run_in_executor(self.control_pool, sup.recover)
+            except Exception as e:
+                logging.warning(f"Supervisor error: {e}")
+
+    # ------------------------------------------------------------ HTTP
+    async def handle_http(self, reader, writer):
+        try:
+            head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            request_line, *header_lines = head.decode('latin-1').split("\r\n")
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            for h in header_lines:
+                if ':' in h:
+                    k, v = h.split(':', 1)
+                    headers[k.strip().lower()] = v.strip()
+            body = b""
+            length = int(headers.get('content-length', 0) or 0)
+            if length:
+                body = await asyncio.wait_for(reader.readexactly(length), 10)
+
+            status, payload = await self.route(method, path, body)
+        except Exception as e:
+            status, payload = 400, {'error': str(e)}
+
+        data = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == 'GET' and path == '/health':
+            status = await self.loop.run_in_executor(self.control_pool, self.server.health_status)
+            status['inbound_queue'] = self.inbound.qsize()
+            status['outbound_queue'] = self.outbound.qsize()
+            return 200, status
+        if method == 'GET' and path.split('?')[0] == '/stats':
+            data = self.server.analytics_job.stats
+            if '?day=' in path:
+                day = path.split('?day=', 1)[1]
+                return 200, {'generated': data['generated'], 'day': day,
+                             'stats': data['days'].get(day)}
+            return 200, data
+        if method == 'POST' and path.startswith('/test_sms/'):
+            number = path[len('/test_sms/'):]
+            data = json.loads(body or b"{}")
+            await self.outbound.put((number, data.get('message', 'Test from AiCell'), None, None))
+            return 200, {'success': True, 'queued': True}
+        return 404, {'error': 'not found'}
+
+    # ------------------------------------------------------------ main
+    async def run(self, port):
+        self.supervisor = ModemSupervisor(
+            self._command_from_thread, self._reopen_from_thread)
+        self.server.supervisor = self.supervisor
+
+        self.modem = AsyncModem(self.server.gsm_serial, self.inbound,
+                                on_activity=self.supervisor.note_activity,
+                                on_stored=self.drain_soon)
+        self.modem.attach()
+        # Bytes init_gsm set aside, then SMS stored while we were down
+        leftover = self.server.take_backlog()
+        if leftover:
+            self.modem.feed(leftover)
+        self.drain_soon()
+
+        tasks = [asyncio.create_task(self.reply_worker()) for _ in range(REPLY_WORKERS)]
+        tasks.append(asyncio.create_task(self.sender()))
+        if not self.server.REPLAY_TRACE:
+            # Probe writes would open replay gates out of step with the trace
+            tasks.append(asyncio.create_task(self.supervise()))
+
+        http = await asyncio.start_server(self.handle_http, '0.0.0.0', port)
+        print(f"\nWeb Dashboard: http://127.0.0.1:{port}/health")
+        print("AiCell ASYNC runtime - SEND SMS NOW TO TEST!")
+        print("=" * 60)
+        async with http:
+            await asyncio.gather(http.serve_forever(), *tasks)
+
+
+def main(server=None, port=5000):
+    if server is None:
+        import AiCell_Main_Server as server
+
+    print("AiCell SMS AI Server Starting (asyncio)...")
+    # The event loop owns the port from here on, so it also drains storage
+    if not server.init_gsm(drain=False):
+        print("\nGSM FAILED. Check SIM, antenna and port.")
+        server.list_available_ports()
+        return
+
+    server.ConfigWatcher(server.CONFIG_PATH, server.config, server.apply_config).start()
+    server.knowledge_base.watch()
+    server.analytics_job.start()
+
+    async def start():
+        await AsyncRuntime(server).run(port)
+
+    try:
+        asyncio.run(start())
+    except KeyboardInterrupt:
+        print("\nStopped by user.")
+    finally:
+        server.release_modem()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,245 @@
+"""
+AiCell runtime configuration
+Typed settings loaded from a JSON file and AICELL_* environment variables
+(env wins), plus a watcher that reloads the file while the server runs.
+
+    aicell_config.json       (see aicell_config.example.json)
+    AICELL_API_KEY=... AICELL_MODEL=... python AiCell_Main_Server.py
+"""
+import copy
+import json
+import logging
+import os
+import threading
+from dataclasses import dataclass, field, fields, asdict, is_dataclass
+
+CONFIG_FILE = 'aicell_config.json'
+
+
+@dataclass
+class GsmConfig:
+    number: str = "+8801833890003"
+    port: str = ""                 # empty = auto-detect
+    baud_rate: int = 115200        # first rate tried when detecting the modem
+    max_baud_rate: int = 460800    # upper bound for AT+IPR negotiation
+    flow_control: str = "auto"     # "auto" (if CTS is wired) | "on" | "off"
+    serial_timeout: int = 5
+    cnmi_modes: list = field(default_factory=lambda: [
+        "AT+CNMI=2,2,0,0,0",
+        "AT+CNMI=1,2,0,0,0",
+        "AT+CNMI=2,1,0,0,0",
+        "AT+CNMI=1,1,0,0,0",
+    ])
+
+
+@dataclass
+class AIConfig:
+    api_key: str = ""
+    url: str = "https://openrouter.ai/api/v1/chat/completions"
+    model: str = "meta-llama/llama-3.1-8b-instruct:free"
+    max_tokens: int = 80
+    batch_window: float = 0.5
+    max_batch: int = 8
+    max_concurrency: int = 4
+
+
+@dataclass
+class LimitsConfig:
+    max_replies_per_minute: int = 5   # per sender, 0 = unlimited
+
+
+@dataclass
+class LoggingConfig:
+    level: str = "INFO"
+
+
+@dataclass
+class AppConfig:
+    gsm: GsmConfig = field(default_factory=GsmConfig)
+    ai: AIConfig = field(default_factory=AIConfig)
+    limits: LimitsConfig = field(default_factory=LimitsConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+    responses: dict = field(default_factory=dict)   # merged over built-in replies
+
+
+# Settings that only take effect after the modem port is re-initialized
+PORT_SETTINGS = ('port', 'baud_rate', 'max_baud_rate', 'flow_control',
+                 'serial_timeout', 'cnmi_modes')
+
+# Allowed values and lower bounds, checked on every load
+CHOICES = {
+    'flow_control': ('auto', 'on', 'off'),
+    'level': ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'),
+}
+MINIMUMS = {
+    'baud_rate': 1200, 'max_baud_rate': 1200, 'serial_timeout': 1,
+    'max_tokens': 1, 'batch_window': 0, 'max_batch': 1, 'max_concurrency': 1,
+    'max_replies_per_minute': 0,
+}
+
+ENV_VARS = {
+    'AICELL_API_KEY': ('ai', 'api_key'),
+    'AICELL_MODEL': ('ai', 'model'),
+    'AICELL_AI_URL': ('ai', 'url'),
+    'AICELL_GSM_NUMBER': ('gsm', 'number'),
+    'AICELL_PORT': ('gsm', 'port'),
+    'AICELL_BAUD_RATE': ('gsm', 'baud_rate'),
+    'AICELL_LOG_LEVEL': ('logging', 'level'),
+    'AICELL_MAX_REPLIES_PER_MINUTE': ('limits', 'max_replies_per_minute'),
+}
+
+
+# ==================================================================
+# =========================== LOADING ==============================
+# ==================================================================
+
+def _convert(name, kind, value):
+    """Check a file / env value against the field's type; raises ValueError"""
+    if kind is bool:
+        if isinstance(value, bool):
+            return value
+        return str(value).lower() in ('1', 'true', 'yes', 'on')
+
+    if kind in (int, float):
+        if isinstance(value, bool):
+            raise ValueError("expected a number")
+        if isinstance(value, str):
+            value = value.strip()
+        number = float(value)
+        if kind is int and not number.is_integer():
+            raise ValueError("expected a whole number")
+        value = kind(number)
+        if name in MINIMUMS and value < MINIMUMS[name]:
+            raise ValueError(f"must be at least {MINIMUMS[name]}")
+        return value
+
+    if kind is str:
+        if not isinstance(value, str):
+            raise ValueError("expected a string")
+        if name in CHOICES:
+            value = value.strip().upper() if name == 'level' else value.strip().lower()
+            if value not in CHOICES[name]:
+                raise ValueError(f"expected one of {', '.join(CHOICES[name])}")
+        return value
+
+    if kind is list:
+        if not isinstance(value, list) or not all(isinstance(v, str) for v in value):
+            raise ValueError("expected a list of strings")
+        return list(value)
+
+    if kind is dict:
+        if not isinstance(value, dict) or not all(
+                isinstance(k, str) and isinstance(v, str) for k, v in value.items()):
+            raise ValueError("expected an object of strings")
+        return dict(value)
+
+    return value
+
+
+def _apply(section, values, where, running=None):
+    """Set fields from values; a bad value keeps the running one (or the default)"""
+    if not isinstance(values, dict):
+        logging.warning(f"Config {where}: expected an object, ignoring {values!r}")
+        return
+    for f in fields(section):
+        if f.name not in values:
+            continue
+        current = getattr(section, f.name)
+        previous = getattr(running, f.name) if running is not None else None
+        if is_dataclass(current):
+            _apply(current, values[f.name] or {}, f"{where}.{f.name}", previous)
+            continue
+        try:
+            setattr(section, f.name, _convert(f.name, f.type, values[f.name]))
+        except (TypeError, ValueError) as e:
+            if running is not None:
+                current = copy.deepcopy(previous)
+                setattr(section, f.name, current)
+            logging.warning(f"Config {where}.{f.name}: bad value {values[f.name]!r} ({e}), "
+                            f"keeping {current!r}")
+    unknown = set(values) - {f.name for f in fields(section)}
+    if unknown:
+        logging.warning(f"Config {where}: unknown keys {sorted(unknown)}")
+
+
+def load_config(path=CONFIG_FILE, running=None):
+    """
+    Defaults <- JSON file <- environment. Raises on an unreadable file;
+    a value of the wrong type or outside its allowed values is logged and
+    the running value kept (the default on first load).
+    """
+    config = AppConfig()
+    if path and os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            _apply(config, json.load(f), 'config', running)
+
+    for var, (section, name) in ENV_VARS.items():
+        if var in os.environ:
+            _apply(getattr(config, section), {name: os.environ[var]}, var,
+                   getattr(running, section) if running is not None else None)
+    return config
+
+
+def port_settings_changed(old, new):
+    return any(getattr(old.gsm, k) != getattr(new.gsm, k) for k in PORT_SETTINGS)
+
+
+def to_dict(config):
+    data = asdict(config)
+    if data['ai']['api_key']:
+        data['ai']['api_key'] = '***'
+    return data
+
+
+# ==================================================================
+# =========================== HOT RELOAD ===========================
+# ==================================================================
+
+class ConfigWatcher:
+    """Polls the config file and hands every valid new version to on_change"""
+
+    def __init__(self, path, config, on_change, interval=2):
+        self.path = path
+        self.config = config
+        self.on_change = on_change
+        self.interval = interval
+        self._mtime = self._stat()
+        self._stop = threading.Event()
+
+    def _stat(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return None
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            mtime = self._stat()
+            if mtime == self._mtime:
+                continue
+            self._mtime = mtime
+            self.reload()
+
+    def reload(self):
+        try:
+            new = load_config(self.path, running=self.config)
+        except (OSError, ValueError) as e:
+            # Half-saved or broken file: keep running on the old settings
+            logging.warning(f"Config reload failed, keeping current settings: {e}")
+            return False
+        try:
+            self.on_change(self.config, new)
+        except Exception as e:
+            logging.warning(f"Config apply failed, keeping current settings: {e}")
+            return False
+        # Only a config that applied cleanly becomes the one compared against
+        self.config = new
+        print(f"CONFIG RELOADED from {self.path}")
+        logging.info(f"Config reloaded from {self.path}")
+        return True
@@ -0,0 +1,251 @@
+"""
+AiCell offline knowledge base
+Curated Q&A documents (Markdown / CSV) in ./knowledge, indexed into a
+BM25 inverted index that is saved next to the sources and updated
+incrementally when files change, so FAQ answers need no internet.
+
+CSV:       question,answer[,topic]
+Markdown:  "## Question" heading, answer in the paragraph(s) below it
+"""
+import csv
+import json
+import logging
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+KB_DIR = 'knowledge'
+INDEX_FILE = 'knowledge_index.json'
+
+# BM25 parameters
+K1 = 1.5
+B = 0.75
+QUESTION_WEIGHT = 2  # question words count double against answer words
+# A confident match must also contain more than this share of the query's
+# words, so one shared word ("much" in "thank you so much") isn't enough
+MIN_COVERAGE = 0.5
+
+# Same tokenization as subscribers.py: keep Bangla vowel signs inside words
+TOKEN_RE = re.compile(r'[\wঀ-৿]+')
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "what", "how", "why", "when", "where",
+    "who", "which", "do", "does", "i", "my", "me", "you", "your", "can", "to",
+    "of", "in", "on", "for", "and", "or", "it", "be", "should", "with", "about",
+    "this", "that", "there", "has", "have", "so", "any", "please", "need",
+    "info", "information", "tell",
+    "কি", "কী", "কেন", "কিভাবে", "আমি", "আমার", "এর", "ও", "এবং",
+}
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall((text or "").lower()) if t not in STOPWORDS]
+
+
+# ==================================================================
+# =========================== LOADERS ==============================
+# ==================================================================
+
+def load_csv(path):
+    docs = []
+    with open(path, encoding='utf-8', newline='') as f:
+        for row in csv.DictReader(f):
+            question = (row.get('question') or "").strip()
+            answer = (row.get('answer') or "").strip()
+            if question and answer:
+                docs.append({'question': question, 'answer': answer,
+                             'topic': (row.get('topic') or "").strip()})
+    return docs
+
+
+def load_markdown(path):
+    docs = []
+    topic = os.path.splitext(os.path.basename(path))[0]
+    question, answer = None, []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.rstrip()
+            if line.startswith('## '):
+                if question and answer:
+                    docs.append({'question': question, 'answer': ' '.join(answer), 'topic': topic})
+                question, answer = line[3:].strip(), []
+            elif question and line.strip() and not line.startswith('#'):
+                answer.append(line.strip())
+    if question and answer:
+        docs.append({'question': question, 'answer': ' '.join(answer), 'topic': topic})
+    return docs
+
+
+LOADERS = {'.csv': load_csv, '.md': load_markdown}
+
+
+# ==================================================================
+# =========================== INDEX ================================
+# ==================================================================
+
+class KnowledgeBase:
+    """BM25 inverted index over curated Q&A pairs"""
+
+    def __init__(self, kb_dir=KB_DIR, index_path=None, min_score=3.0,
+                 min_coverage=MIN_COVERAGE):
+        self.kb_dir = kb_dir
+        self.index_path = index_path or os.path.join(kb_dir, INDEX_FILE)
+        self.min_score = min_score
+        self.min_coverage = min_coverage
+
+        self.docs = {}        # doc_id -> {question, answer, topic, source, length, tf}
+        self.postings = {}    # term -> {doc_id: weighted tf}
+        self.files = {}       # source path -> mtime
+        self.next_id = 0
+        self.total_length = 0
+
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+
+        self.load()
+        self.refresh()
+
+    # ------------------------------------------------------ persistence
+    def load(self):
+        """Load a previously saved index; postings are rebuilt from docs"""
+        if not os.path.exists(self.index_path):
+            return
+        try:
+            with open(self.index_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Knowledge index unreadable, rebuilding: {e}")
+            return
+        with self._lock:
+            self.files = data.get('files', {})
+            for doc in data.get('docs', []):
+                self._add_doc(doc)
+
+    def save(self):
+        with self._lock:
+            data = {
+                'files': self.files,
+                'docs': [{k: d[k] for k in ('question', 'answer', 'topic', 'source')}
+                         for d in self.docs.values()],
+            }
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp, self.index_path)
+
+    # -------------------------------------------------------- updating
+    def refresh(self):
+        """Re-index only the source files that were added, changed or removed"""
+        if not os.path.isdir(self.kb_dir):
+            return 0
+
+        current = {}
+        for name in sorted(os.listdir(self.kb_dir)):
+            ext = os.path.splitext(name)[1].lower()
+            if ext in LOADERS:
+                path = os.path.join(self.kb_dir, name)
+                current[path] = os.path.getmtime(path)
+
+        changed = [p for p, m in current.items() if self.files.get(p) != m]
+        removed = [p for p in self.files if p not in current]
+        if not changed and not removed:
+            return 0
+
+        with self._lock:
+            for path in changed + removed:
+                self._remove_source(path)
+                self.files.pop(path, None)
+            for path in changed:
+                ext = os.path.splitext(path)[1].lower()
+                try:
+                    docs = LOADERS[ext](path)
+                except Exception as e:
+                    logging.warning(f"Knowledge file {path} skipped: {e}")
+                    continue
+                for doc in docs:
+                    doc['source'] = path
+                    self._add_doc(doc)
+                self.files[path] = current[path]
+
+        self.save()
+        print(f"Knowledge base: {len(changed)} updated, {len(removed)} removed, "
+              f"{len(self.docs)} entries")
+        return len(changed) + len(removed)
+
+    def watch(self, interval=10):
+        """Poll the knowledge folder so new content goes live without a restart"""
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    self.refresh()
+                except Exception as e:
+                    logging.warning(f"Knowledge refresh failed: {e}")
+        threading.Thread(target=run, daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _add_doc(self, doc):
+        tf = Counter(tokenize(doc['question']) * QUESTION_WEIGHT)
+        tf.update(tokenize(doc['answer']))
+        doc_id = self.next_id
+        self.next_id += 1
+
+        doc = dict(doc, length=sum(tf.values()), tf=tf)
+        self.docs[doc_id] = doc
+        self.total_length += doc['length']
+        for term, count in tf.items():
+            self.postings.setdefault(term, {})[doc_id] = count
+
+    def _remove_source(self, path):
+        for doc_id in [i for i, d in self.docs.items() if d['source'] == path]:
+            doc = self.docs.pop(doc_id)
+            self.total_length -= doc['length']
+            for term in doc['tf']:
+                postings = self.postings.get(term)
+                if postings is not None:
+                    postings.pop(doc_id, None)
+                    if not postings:
+                        del self.postings[term]
+
+    # ---------------------------------------------------------- search
+    def search(self, query, limit=3):
+        """[(score, doc), ...] best first"""
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.docs)
+            if not n or not terms:
+                return []
+            avg_len = self.total_length / n
+
+            scores = {}
+            for term in terms:
+                postings = self.postings.get(term)
+                if not postings:
+                    continue
+                df = len(postings)
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                for doc_id, tf in postings.items():
+                    length = self.docs[doc_id]['length']
+                    norm = tf * (K1 + 1) / (tf + K1 * (1 - B + B * length / avg_len))
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * norm
+
+            best = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]
+            return [(score, self.docs[doc_id]) for doc_id, score in best]
+
+    def match(self, query):
+        """Best entry if it is a confident match, else None"""
+        terms = set(tokenize(query))
+        for score, doc in self.search(query):
+            if score < self.min_score:
+                break
+            # A close second can cover more of the query than the top score
+            if len(terms & doc['tf'].keys()) > self.min_coverage * len(terms):
+                return doc
+        return None
+
+    def answer(self, query):
+        """Best answer text if it is a confident match, else None"""
+        doc = self.match(query)
+        return doc['answer'] if doc else None
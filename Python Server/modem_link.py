@@ -0,0 +1,185 @@
+"""
+AiCell modem link tuning
+Finds the rate the modem is currently talking at (autobaud), moves it to
+the fastest rate that passes a stability check (AT+IPR), turns on RTS/CTS
+hardware flow control when the wiring supports it (AT+IFC), and saves the
+result in modem_link.json so the next start opens the port at the right
+rate straight away.
+
+The rate is never written to the modem profile (AT&W), and on every clean
+exit the server puts the modem back into autobaud (AT+IPR=0), so the
+9600-baud Arduino / ESP32 sketches can still talk to it. SIM800 modules
+keep a fixed IPR across power cycles, so if the server is killed before
+it can do that, send AT+IPR=0 at the negotiated rate (see modem_link.json)
+or run with gsm.max_baud_rate at the rate the sketches use.
+"""
+import json
+import logging
+import os
+import time
+
+LINK_FILE = 'modem_link.json'
+
+# Rates SIM800-series modems accept for AT+IPR, fastest first
+SUPPORTED_RATES = (460800, 230400, 115200, 57600, 38400, 19200, 9600)
+
+STABILITY_PROBES = 5
+
+
+# ==================================================================
+# =========================== SAVED STATE ==========================
+# ==================================================================
+
+def load_link(path=LINK_FILE):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_link(port, baud_rate, flow_control, path=LINK_FILE):
+    tmp = path + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'port': port, 'baud_rate': baud_rate,
+                   'flow_control': flow_control}, f)
+    os.replace(tmp, path)
+
+
+# ==================================================================
+# =========================== AUTOBAUD =============================
+# ==================================================================
+
+def probe(ser, tries=3, keep=None):
+    """
+    True when the modem answers a bare AT at the port's current rate.
+    Whatever else the modem sent (an SMS arriving mid-probe) goes to
+    keep(text) instead of being thrown away.
+    """
+    for _ in range(tries):
+        try:
+            pending = ser.read(ser.in_waiting) if ser.in_waiting else b''
+            # SIM800 autobaud locks onto the rate of the first "AT" it sees
+            ser.write(b'AT\r\n')
+            time.sleep(0.3)
+            resp = (pending + ser.read(ser.in_waiting)).decode('utf-8', errors='ignore')
+        except Exception:
+            return False
+        if keep:
+            keep(resp)
+        if 'OK' in resp:
+            return True
+    return False
+
+
+def candidate_rates(preferred=None, configured=None):
+    """Saved rate first, then the configured one, then everything else"""
+    rates = []
+    for rate in (preferred, configured) + SUPPORTED_RATES:
+        if rate and rate not in rates:
+            rates.append(rate)
+    return rates
+
+
+def detect_baud(ser, rates, keep=None):
+    """Switch an open port through `rates` until the modem answers"""
+    for rate in rates:
+        ser.baudrate = rate
+        time.sleep(0.1)
+        if probe(ser, keep=keep):
+            return rate
+    return None
+
+
+# ==================================================================
+# =========================== NEGOTIATION ==========================
+# ==================================================================
+
+def stable(send_command, probes=STABILITY_PROBES):
+    """Several clean round trips, including a multi-field reply"""
+    for _ in range(probes):
+        if 'OK' not in send_command("AT", 1):
+            return False
+    return '+CSQ:' in send_command("AT+CSQ", 1)
+
+
+def negotiate_baud(ser, send_command, current, max_rate, keep=None):
+    """Move the modem to the fastest rate <= max_rate that proves stable"""
+    for rate in SUPPORTED_RATES:
+        if rate > max_rate or rate <= current:
+            continue
+
+        print(f"Trying {rate} baud...")
+        if 'OK' not in send_command(f"AT+IPR={rate}", 1):
+            continue
+        ser.baudrate = rate
+        time.sleep(0.2)
+        if stable(send_command):
+            print(f"BAUD RATE: {rate}")
+            logging.info(f"Modem link moved from {current} to {rate} baud")
+            return rate
+
+        # Not stable: ask the modem to go back and follow it
+        logging.warning(f"{rate} baud unstable, falling back to {current}")
+        send_command(f"AT+IPR={current}", 1)
+        ser.baudrate = current
+        time.sleep(0.2)
+        if not probe(ser, keep=keep):
+            # The command didn't get through; find wherever the modem is now
+            found = detect_baud(ser, [current, rate], keep)
+            if found and found != current:
+                send_command(f"AT+IPR={current}", 1)
+                ser.baudrate = current
+                time.sleep(0.2)
+    return current
+
+
+def enable_flow_control(ser, send_command, mode='auto'):
+    """RTS/CTS on both ends; 'auto' only when the modem is driving CTS"""
+    if mode == 'off':
+        send_command("AT+IFC=0,0", 1)
+        ser.rtscts = False
+        return False
+    if mode == 'auto':
+        try:
+            wired = ser.cts
+        except Exception:
+            wired = False
+        if not wired:
+            print("Flow control: CTS not wired, staying off")
+            return False
+
+    if 'OK' not in send_command("AT+IFC=2,2", 1):
+        return False
+    ser.rtscts = True
+    if stable(send_command, probes=2):
+        print("Flow control: RTS/CTS ON")
+        return True
+
+    # CTS never asserted: without this the port would stall on every write
+    ser.rtscts = False
+    send_command("AT+IFC=0,0", 1)
+    print("Flow control: RTS/CTS failed, turned off")
+    return False
+
+
+def tune_link(ser, send_command, port, current, max_rate, flow_control='auto', keep=None):
+    """Negotiate rate + flow control and remember them; returns the rate"""
+    rate = negotiate_baud(ser, send_command, current, max_rate, keep)
+    flow = enable_flow_control(ser, send_command, flow_control)
+    # No AT&W: the modem profile keeps the rate other firmware expects
+    try:
+        save_link(port, rate, flow)
+    except OSError as e:
+        logging.warning(f"Could not save link settings: {e}")
+    return rate
+
+
+def restore_autobaud(send_command):
+    """Put the modem back into autobaud before the server lets go of it"""
+    resp = send_command("AT+IPR=0", 2)
+    if 'OK' in resp:
+        print("Modem back in autobaud mode")
+        return True
+    logging.warning(f"Could not restore modem autobaud: {resp.strip()}")
+    return False
@@ -0,0 +1,148 @@
+"""
+AiCell modem health supervisor
+Runs beside the SMS monitor, watches responsiveness, signal (CSQ) and
+network registration (CREG), and walks an escalation ladder with backoff
+when the modem goes bad:
+
+    1. soft reset   - AT probe + automatic operator re-selection (AT+COPS=0)
+    2. CFUN cycle   - radio off/on, then AT+COPS=0
+    3. port reopen  - close the serial port and run the full init again
+"""
+import re
+import threading
+import time
+import logging
+
+CSQ_RE = re.compile(r"\+CSQ:\s*(\d+),")
+CREG_RE = re.compile(r"\+CREG:\s*\d,(\d)")
+
+CREG_STATUS = {
+    0: "Not registered",
+    1: "Registered (home)",
+    2: "Searching...",
+    3: "Registration denied",
+    4: "Unknown",
+    5: "Registered (roaming)",
+}
+
+RECOVERY_STEPS = ("soft_reset", "cfun_cycle", "port_reopen")
+
+
+class ModemSupervisor:
+    """Periodic modem health checks with escalating recovery"""
+
+    def __init__(self, send_command, reopen_port, probe_interval=30,
+                 idle_grace=20, base_backoff=10, max_backoff=300):
+        # send_command(cmd, wait_time) -> str, reopen_port() -> bool
+        self.send_command = send_command
+        self.reopen_port = reopen_port
+        self.probe_interval = probe_interval
+        self.idle_grace = idle_grace
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+
+        self.last_activity = time.monotonic()
+        self.responsive = True
+        self.signal = None
+        self.registration = None
+        self.failures = 0
+        self.last_recovery = None
+        self.last_check = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------------------------------------------------------- hooks
+    def note_activity(self):
+        """Called by the data path whenever the modem sends us bytes"""
+        self.last_activity = time.monotonic()
+
+    def status(self):
+        return {
+            'responsive': self.responsive,
+            'signal': self.signal,
+            'registration': CREG_STATUS.get(self.registration, self.registration),
+            'failures': self.failures,
+            'last_recovery': self.last_recovery,
+            'last_check': self.last_check,
+        }
+
+    # ------------------------------------------------------- lifecycle
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self._next_delay()):
+            try:
+                if not self.check():
+                    self.recover()
+            except Exception as e:
+                logging.warning(f"Supervisor error: {e}")
+
+    def _next_delay(self):
+        if not self.failures:
+            return self.probe_interval
+        return min(self.base_backoff * 2 ** (self.failures - 1), self.max_backoff)
+
+    # ---------------------------------------------------------- checks
+    def check(self):
+        """Run one health check; True when the modem is usable"""
+        self.last_check = time.strftime('%Y-%m-%d %H:%M:%S')
+
+        # Recent inbound traffic already proves the modem is alive, so
+        # only probe with AT when the line has been quiet.
+        if time.monotonic() - self.last_activity > self.idle_grace:
+            self.responsive = "OK" in self.send_command("AT", 1)
+            if not self.responsive:
+                return False
+        else:
+            self.responsive = True
+
+        m = CSQ_RE.search(self.send_command("AT+CSQ", 1))
+        if m:
+            value = int(m.group(1))
+            self.signal = None if value == 99 else value
+
+        m = CREG_RE.search(self.send_command("AT+CREG?", 1))
+        if m:
+            self.registration = int(m.group(1))
+
+        healthy = self.registration in (None, 1, 5) and self.signal != 0
+        if healthy and self.failures:
+            print("MODEM RECOVERED")
+            logging.info("Modem recovered")
+            self.failures = 0
+        return healthy
+
+    # -------------------------------------------------------- recovery
+    def recover(self):
+        """Take the next step on the escalation ladder"""
+        step = RECOVERY_STEPS[min(self.failures, len(RECOVERY_STEPS) - 1)]
+        self.failures += 1
+        self.last_recovery = step
+        print(f"\nMODEM UNHEALTHY -> {step} (attempt {self.failures})")
+        logging.warning(
+            f"Modem unhealthy (responsive={self.responsive}, signal={self.signal}, "
+            f"creg={self.registration}); running {step}"
+        )
+        getattr(self, '_' + step)()
+
+    def _soft_reset(self):
+        self.send_command("AT", 1)
+        self.send_command("AT+COPS=0", 10)
+
+    def _cfun_cycle(self):
+        self.send_command("AT+CFUN=0", 5)
+        self.send_command("AT+CFUN=1", 10)
+        self.send_command("AT+COPS=0", 10)
+
+    def _port_reopen(self):
+        if self.reopen_port():
+            self.note_activity()
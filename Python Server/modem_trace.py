@@ -0,0 +1,269 @@
+"""
+AiCell modem traffic record / replay
+Records every byte to and from the modem with nanosecond timestamps into a
+compact binary trace, and plays a trace back as a fake serial port so real
+sessions become repeatable tests and benchmarks without hardware.
+
+    python AiCell_Main_Server.py --record session.trace
+    python AiCell_Main_Server.py --replay session.trace --speed 10
+    python modem_trace.py info session.trace
+    python modem_trace.py bench session.trace --repeat 100
+
+File format (little endian):
+    header  b"AICTRC1\\n" + float64 wall-clock start time
+    record  uint64 ns since start, uint8 direction (0 = modem->server,
+            1 = server->modem), uint32 length, payload bytes
+"""
+import struct
+import sys
+import threading
+import time
+
+MAGIC = b"AICTRC1\n"
+HEADER = struct.Struct('<d')
+RECORD = struct.Struct('<QBI')
+
+RX = 0  # modem -> server
+TX = 1  # server -> modem
+
+
+# ==================================================================
+# =========================== RECORDING ============================
+# ==================================================================
+
+class TraceWriter:
+    def __init__(self, path):
+        self._file = open(path, 'wb')
+        self._lock = threading.Lock()
+        self._start = time.perf_counter_ns()
+        self._last_flush = self._start
+        self._file.write(MAGIC + HEADER.pack(time.time()))
+
+    def record(self, direction, data):
+        if not data:
+            return
+        now = time.perf_counter_ns()
+        with self._lock:
+            self._file.write(RECORD.pack(now - self._start, direction, len(data)))
+            self._file.write(data)
+            # Keep the file usable if the server is killed mid-session
+            if now - self._last_flush > 1_000_000_000:
+                self._file.flush()
+                self._last_flush = now
+
+    def flush(self):
+        with self._lock:
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingSerial:
+    """Wraps a serial.Serial and copies all traffic into a trace"""
+
+    def __init__(self, ser, trace):
+        object.__setattr__(self, '_ser', ser)
+        object.__setattr__(self, '_trace', trace)
+
+    def read(self, size=1):
+        data = self._ser.read(size)
+        self._trace.record(RX, data)
+        return data
+
+    def write(self, data):
+        self._trace.record(TX, bytes(data))
+        return self._ser.write(data)
+
+    def close(self):
+        self._trace.flush()
+        self._ser.close()
+
+    def __getattr__(self, name):
+        return getattr(self._ser, name)
+
+    def __setattr__(self, name, value):
+        # e.g. "timeout" must reach the real port
+        setattr(self._ser, name, value)
+
+
+# ==================================================================
+# =========================== REPLAY ===============================
+# ==================================================================
+
+def read_trace(path):
+    """(start_time, [(t_ns, direction, data), ...])"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if not raw.startswith(MAGIC):
+        raise ValueError(f"{path} is not an AiCell trace")
+    pos = len(MAGIC)
+    (start,) = HEADER.unpack_from(raw, pos)
+    pos += HEADER.size
+
+    events = []
+    while pos + RECORD.size <= len(raw):
+        t, direction, length = RECORD.unpack_from(raw, pos)
+        pos += RECORD.size
+        events.append((t, direction, raw[pos:pos + length]))
+        pos += length
+    return start, events
+
+
+class ReplaySerial:
+    """
+    Serial-port stand-in that plays back the modem side of a trace.
+
+    Inbound bytes are released on the recorded timeline divided by
+    `speed` (0 = as fast as possible). Bytes the modem sent after a
+    server write are held back until the server has made that write, so
+    replies always follow their commands. If the server stops writing in
+    step with the trace, a gate opens after `gate_timeout` seconds.
+    """
+
+    def __init__(self, path, speed=1.0, gate_timeout=5.0):
+        self.start, self.events = read_trace(path)
+        self.speed = speed
+        self.gate_timeout = gate_timeout
+        self.timeout = None
+        self.is_open = True
+        self.port = path
+
+        self._idx = 0
+        self._pending = bytearray()
+        self._writes = 0          # writes made by the server so far
+        self._gates = 0           # recorded writes passed so far
+        self._gate_since = None
+        self._anchor_real = time.monotonic()
+        self._anchor_t = self.events[0][0] if self.events else 0
+        self._lock = threading.Lock()
+        self.mismatches = 0
+
+    # ---------------------------------------------------------- timeline
+    def _release(self):
+        now = time.monotonic()
+        while self._idx < len(self.events):
+            t, direction, data = self.events[self._idx]
+            if direction == TX:
+                if self._writes <= self._gates:
+                    if self._gate_since is None:
+                        self._gate_since = now
+                    if now - self._gate_since < self.gate_timeout:
+                        break
+                self._gates += 1
+                self._gate_since = None
+                self._anchor_real, self._anchor_t = now, t
+            else:
+                if self.speed and now < self._anchor_real + (t - self._anchor_t) / 1e9 / self.speed:
+                    break
+                self._pending += data
+            self._idx += 1
+
+    @property
+    def finished(self):
+        with self._lock:
+            self._release()
+            return self._idx >= len(self.events) and not self._pending
+
+    # ------------------------------------------------------ serial API
+    @property
+    def in_waiting(self):
+        with self._lock:
+            self._release()
+            return len(self._pending)
+
+    def read(self, size=1):
+        deadline = time.monotonic() + (self.timeout or 0)
+        while True:
+            with self._lock:
+                self._release()
+                if self._pending or self._idx >= len(self.events):
+                    data = bytes(self._pending[:size])
+                    del self._pending[:size]
+                    return data
+            if time.monotonic() >= deadline:
+                return b""
+            time.sleep(0.001)
+
+    def write(self, data):
+        with self._lock:
+            # Compare with the next recorded write, if it's still ahead
+            for t, direction, recorded in self.events[self._idx:]:
+                if direction == TX:
+                    if recorded != bytes(data):
+                        self.mismatches += 1
+                    break
+            self._writes += 1
+            self._release()
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def flushInput(self):
+        pass
+
+    def flushOutput(self):
+        pass
+
+    def close(self):
+        self.is_open = False
+
+
+# ==================================================================
+# =========================== CLI ==================================
+# ==================================================================
+
+def trace_info(path):
+    start, events = read_trace(path)
+    rx = [e for e in events if e[1] == RX]
+    tx = [e for e in events if e[1] == TX]
+    duration = events[-1][0] / 1e9 if events else 0
+    print(f"Trace    : {path}")
+    print(f"Recorded : {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(start))}")
+    print(f"Duration : {duration:.1f} s")
+    print(f"Inbound  : {len(rx)} chunks, {sum(len(e[2]) for e in rx)} bytes")
+    print(f"Outbound : {len(tx)} chunks, {sum(len(e[2]) for e in tx)} bytes")
+
+
+def trace_bench(path, repeat=1):
+    """Run the inbound stream through the SMS parser at full speed"""
+    from sms_parser import parse_incoming_sms
+
+    _, events = read_trace(path)
+    stream = b"".join(e[2] for e in events if e[1] == RX).decode('utf-8', errors='ignore')
+
+    parsed = 0
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        lines = stream.split('\n')
+        starts = [i for i, line in enumerate(lines) if line.strip().startswith('+CMT:')]
+        # Hand the parser everything up to the next +CMT so multi-line
+        # bodies are parsed (and timed) in full
+        for i, end in zip(starts, starts[1:] + [len(lines)]):
+            sender, msg, _ = parse_incoming_sms('\n'.join(lines[i:end]))
+            if sender and msg:
+                parsed += 1
+    elapsed = time.perf_counter() - t0
+
+    size = len(stream.encode('utf-8')) * repeat
+    print(f"Parsed {parsed} SMS from {size} bytes in {elapsed * 1000:.1f} ms "
+          f"({size / max(elapsed, 1e-9) / 1e6:.1f} MB/s)")
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[1] not in ('info', 'bench'):
+        print("Usage: python modem_trace.py info|bench TRACE [--repeat N]")
+        return
+    if sys.argv[1] == 'info':
+        trace_info(sys.argv[2])
+    else:
+        repeat = 1
+        if '--repeat' in sys.argv:
+            repeat = int(sys.argv[sys.argv.index('--repeat') + 1])
+        trace_bench(sys.argv[2], repeat)
+
+
+if __name__ == '__main__':
+    main()
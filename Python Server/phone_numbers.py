@@ -0,0 +1,168 @@
+"""
+AiCell phone number helpers
+Normalizes sender / recipient numbers to one canonical key (E.164 for
+mobiles, bare digits for operator short codes) so every store keyed by
+number agrees on the same spelling.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+# ============================= RULES ==============================
+DEFAULT_COUNTRY = "BD"
+
+# country -> calling code, national trunk prefix, mobile NSN pattern, operator prefixes
+COUNTRY_RULES = {
+    "BD": {
+        "code": "880",
+        "trunk": "0",
+        "mobile": re.compile(r"1[3-9]\d{8}"),
+        "operators": {
+            "13": "Grameenphone",
+            "17": "Grameenphone",
+            "14": "Banglalink",
+            "19": "Banglalink",
+            "15": "Teletalk",
+            "16": "Robi",
+            "18": "Robi",
+        },
+    },
+    "IN": {
+        "code": "91",
+        "trunk": "0",
+        "mobile": re.compile(r"[6-9]\d{9}"),
+        "operators": {},
+    },
+    "NP": {
+        "code": "977",
+        "trunk": "0",
+        "mobile": re.compile(r"9[678]\d{8}"),
+        "operators": {},
+    },
+}
+
+# Operator service numbers (balance, USSD-SMS, promotions) are 3-6 digits
+SHORT_CODE_RE = re.compile(r"\d{3,6}")
+
+# Any E.164 number: country code + subscriber number, 8-15 digits in total
+E164_RE = re.compile(r"[1-9]\d{7,14}")
+
+# Separators people type or modems echo back: spaces, dashes, dots, brackets
+_SEPARATORS = str.maketrans("", "", " -.()/\t")
+_DIGITS_RE = re.compile(r"\+?\d+")
+
+# Longest calling code first so "977" wins over a shorter overlapping code
+_CODE_TO_COUNTRY = {rules["code"]: country for country, rules in COUNTRY_RULES.items()}
+_CODE_RE = re.compile(
+    "(" + "|".join(sorted(_CODE_TO_COUNTRY, key=len, reverse=True)) + ")(\\d+)"
+)
+
+ParsedNumber = namedtuple("ParsedNumber", "key kind country operator")
+# kind: "mobile" | "international" | "short_code" | "alphanumeric" | "invalid"
+
+INVALID = ParsedNumber(None, "invalid", None, None)
+
+
+# ==================================================================
+# =========================== PARSING ==============================
+# ==================================================================
+
+def _mobile(country, nsn):
+    rules = COUNTRY_RULES[country]
+    if not rules["mobile"].fullmatch(nsn):
+        return None
+    operator = rules["operators"].get(nsn[:2])
+    return ParsedNumber("+" + rules["code"] + nsn, "mobile", country, operator)
+
+
+@lru_cache(maxsize=8192)
+def parse_number(raw, country=DEFAULT_COUNTRY):
+    """Classify a raw number string and return its canonical key"""
+    if not raw:
+        return INVALID
+
+    text = str(raw).strip().strip('"').translate(_SEPARATORS)
+    if not _DIGITS_RE.fullmatch(text):
+        # Alphanumeric sender IDs ("bKash", "GP") cannot be replied to
+        if text and text.isalnum():
+            return ParsedNumber(None, "alphanumeric", None, None)
+        return INVALID
+
+    # International forms: +880..., 00880...
+    international = text.startswith("+")
+    digits = text.lstrip("+")
+    if not international and digits.startswith("00"):
+        international = True
+        digits = digits[2:]
+
+    if international:
+        m = _CODE_RE.fullmatch(digits)
+        if m:
+            return _mobile(_CODE_TO_COUNTRY[m.group(1)], m.group(2)) or INVALID
+        # No rules for this country: a well-formed E.164 number is its own key
+        if E164_RE.fullmatch(digits):
+            return ParsedNumber("+" + digits, "international", None, None)
+        return INVALID
+
+    rules = COUNTRY_RULES.get(country)
+    if rules:
+        # National forms: 01XXXXXXXXX, 1XXXXXXXXX, 8801XXXXXXXXX
+        if digits.startswith(rules["code"]):
+            found = _mobile(country, digits[len(rules["code"]):])
+            if found:
+                return found
+        if rules["trunk"] and digits.startswith(rules["trunk"]):
+            found = _mobile(country, digits[len(rules["trunk"]):])
+            if found:
+                return found
+        found = _mobile(country, digits)
+        if found:
+            return found
+
+    if SHORT_CODE_RE.fullmatch(digits):
+        return ParsedNumber(digits, "short_code", country, None)
+
+    # Country code typed without "+" for a non-default country
+    m = _CODE_RE.fullmatch(digits)
+    if m:
+        found = _mobile(_CODE_TO_COUNTRY[m.group(1)], m.group(2))
+        if found:
+            return found
+
+    return INVALID
+
+
+def normalize_number(raw, country=DEFAULT_COUNTRY):
+    """Return the canonical key (E.164 or short code) or None"""
+    return parse_number(raw, country).key
+
+
+def is_valid_number(raw, country=DEFAULT_COUNTRY):
+    """True for numbers we can send an SMS to"""
+    return parse_number(raw, country).key is not None
+
+
+def get_operator(raw, country=DEFAULT_COUNTRY):
+    """Mobile operator name from the number prefix, if known"""
+    return parse_number(raw, country).operator
+
+
+# ==================================================================
+# =========================== BULK =================================
+# ==================================================================
+
+def normalize_many(numbers, country=DEFAULT_COUNTRY):
+    """Normalize a list of numbers; invalid entries become None"""
+    # Bulk lists repeat heavily (broadcast lists, rate-limit windows),
+    # so resolve every distinct string once and map back.
+    distinct = {raw: parse_number(raw, country).key for raw in set(numbers)}
+    return [distinct[raw] for raw in numbers]
+
+
+def unique_numbers(numbers, country=DEFAULT_COUNTRY):
+    """Normalized, de-duplicated numbers in first-seen order (invalid dropped)"""
+    seen = {}
+    for key in normalize_many(numbers, country):
+        if key is not None and key not in seen:
+            seen[key] = None
+    return list(seen)
@@ -0,0 +1,62 @@
+"""
+AiCell SMS parsing
+Turns modem notification text into (sender, message). No imports with
+side effects, so tools like modem_trace.py bench can use it without
+starting the server.
+"""
+import re
+
+from phone_numbers import normalize_number
+
+# +CMGL: <index>,"<stat>","<sender>",...
+CMGL_RE = re.compile(r'\+CMGL:\s*(\d+),"([^"]*)","([^"]*)"')
+
+
+def ends_sms_body(line, body):
+    """True when a (stripped, non-blank-skipped) line is past the SMS body so far"""
+    if not body:
+        # The first line is always text - "OK" is a valid SMS. Only another
+        # notification means the body was empty.
+        return line.startswith('+CMT')
+    return not line or line in ('OK', 'ERROR') or line.startswith('+')
+
+
+def parse_incoming_sms(data):
+    """Extract sender and message"""
+    try:
+        lines = [l.strip() for l in data.split('\n') if l.strip()]
+        sender = None
+        body = []
+        for i, line in enumerate(lines):
+            if line.startswith('+CMT:'):
+                if sender:
+                    break  # the next notification
+                parts = line.split('"')
+                if len(parts) > 1:
+                    sender = normalize_number(parts[1]) or parts[1]
+            elif sender and i > 0:
+                if ends_sms_body(line, body):
+                    break
+                body.append(line)
+        return sender, " ".join(body), ""
+    except:
+        return None, "", ""
+
+
+def parse_stored_sms(data):
+    """[(index, sender, message), ...] for received SMS in a CMGL listing"""
+    stored = []
+    current = None
+    for line in data.split('\n'):
+        line = line.strip()
+        m = CMGL_RE.match(line)
+        if m:
+            index, stat, number = m.groups()
+            # Drafts / sent messages in the same storage are not ours to answer
+            current = None
+            if stat.startswith('REC'):
+                current = [index, normalize_number(number) or number, []]
+                stored.append(current)
+        elif current and line and not (current[2] and line in ('OK', 'ERROR')):
+            current[2].append(line)  # first line is always text, as for +CMT
+    return [(index, sender, " ".join(body).strip()) for index, sender, body in stored]
@@ -0,0 +1,166 @@
+"""
+AiCell subscriber profiles
+Who is texting: preferred language, topic interests, first/last seen,
+message count and opt-out state. Keyed by the normalized number, served
+from an in-memory hot set and backed by SQLite.
+"""
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from phone_numbers import normalize_number
+
+BANGLA_RE = re.compile(r'[ঀ-৿]')
+
+OPT_OUT_WORDS = {"stop", "unsubscribe", "বন্ধ"}
+OPT_IN_WORDS = {"start", "subscribe", "চালু"}
+
+TOPIC_KEYWORDS = {
+    "health": {"health", "doctor", "fever", "medicine", "pain", "hospital", "pregnant",
+               "diarrhea", "covid", "স্বাস্থ্য", "জ্বর", "ডাক্তার", "ওষুধ"},
+    "agri": {"agri", "crop", "rice", "paddy", "fertilizer", "seed", "farm", "farming",
+             "pest", "cattle", "fish", "কৃষি", "ধান", "সার", "বীজ", "ফসল"},
+    "edu": {"edu", "exam", "school", "study", "math", "english", "science", "result",
+            "ssc", "hsc", "পড়া", "পরীক্ষা", "স্কুল"},
+}
+
+# \w alone splits Bangla words at vowel signs / hasanta
+_WORD_RE = re.compile(r'[\wঀ-৿]+')
+
+COLUMNS = ("number", "language", "topics", "first_seen", "last_seen",
+           "message_count", "opted_out")
+
+
+def detect_language(text):
+    """'bn' when the message contains Bangla script, else 'en'"""
+    return 'bn' if BANGLA_RE.search(text or "") else 'en'
+
+
+def detect_topics(text):
+    words = set(_WORD_RE.findall((text or "").lower()))
+    return {topic for topic, keys in TOPIC_KEYWORDS.items() if words & keys}
+
+
+def _copy(profile):
+    """Profile safe to read outside the store lock"""
+    if profile is None:
+        return None
+    return dict(profile, topics=set(profile['topics']))
+
+
+def opt_keyword(text):
+    """'out' / 'in' when the whole message is an opt-out / opt-in keyword"""
+    word = (text or "").strip().lower().lstrip('#')
+    if word in OPT_OUT_WORDS:
+        return 'out'
+    if word in OPT_IN_WORDS:
+        return 'in'
+    return None
+
+
+class SubscriberStore:
+    """O(1) profile lookup by normalized number"""
+
+    def __init__(self, path='subscribers.db', hot_size=5000):
+        self.hot_size = hot_size
+        self._hot = OrderedDict()
+        self._lock = threading.RLock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # WAL + NORMAL: no fsync per commit on the reply path; a power cut
+        # can lose the last few profile updates but never corrupts the file
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS subscribers (
+                number TEXT PRIMARY KEY,
+                language TEXT,
+                topics TEXT,
+                first_seen REAL,
+                last_seen REAL,
+                message_count INTEGER,
+                opted_out INTEGER
+            )
+        """)
+        self._db.commit()
+
+    # ---------------------------------------------------------- lookup
+    def get(self, number):
+        """Copy of the profile for a number, or None if we've never seen it"""
+        key = normalize_number(number) or number
+        with self._lock:
+            return _copy(self._lookup(key))
+
+    def _lookup(self, key):
+        """The cached profile itself; only touched under the lock"""
+        with self._lock:
+            profile = self._hot.get(key)
+            if profile is not None:
+                self._hot.move_to_end(key)
+                return profile
+
+            row = self._db.execute(
+                f"SELECT {', '.join(COLUMNS)} FROM subscribers WHERE number = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            profile = dict(zip(COLUMNS, row))
+            profile['topics'] = set(filter(None, profile['topics'].split(',')))
+            profile['opted_out'] = bool(profile['opted_out'])
+            self._remember(key, profile)
+            return profile
+
+    # ---------------------------------------------------------- update
+    def record_message(self, number, message):
+        """Update the profile for an inbound message and return it"""
+        key = normalize_number(number) or number
+        now = time.time()
+        with self._lock:
+            profile = self._lookup(key)
+            if profile is None:
+                profile = {
+                    'number': key,
+                    'language': detect_language(message),
+                    'topics': set(),
+                    'first_seen': now,
+                    'last_seen': now,
+                    'message_count': 0,
+                    'opted_out': False,
+                }
+                self._remember(key, profile)
+
+            profile['last_seen'] = now
+            profile['message_count'] += 1
+            keyword = opt_keyword(message)
+            if keyword:
+                profile['opted_out'] = keyword == 'out'
+            elif _WORD_RE.search(message or ""):
+                # Only switch language on a message that actually has words
+                profile['language'] = detect_language(message)
+                profile['topics'] |= detect_topics(message)
+
+            self._save(profile)
+            return _copy(profile)
+
+    def count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM subscribers").fetchone()[0]
+
+    # --------------------------------------------------------- helpers
+    def _remember(self, key, profile):
+        self._hot[key] = profile
+        self._hot.move_to_end(key)
+        while len(self._hot) > self.hot_size:
+            self._hot.popitem(last=False)
+
+    def _save(self, profile):
+        row = dict(profile)
+        row['topics'] = ','.join(sorted(profile['topics']))
+        row['opted_out'] = int(profile['opted_out'])
+        self._db.execute(
+            f"INSERT OR REPLACE INTO subscribers ({', '.join(COLUMNS)}) "
+            f"VALUES ({', '.join('?' * len(COLUMNS))})",
+            tuple(row[c] for c in COLUMNS)
+        )
+        self._db.commit()
@@ -0,0 +1,98 @@
+"""
+Tests for ai_batcher.py
+
+    python -m pytest -q
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ai_batcher import AIBatcher
+
+
+def _recorder(answer_batch=True, delay=0.0):
+    calls = []
+    lock = threading.Lock()
+
+    def ask_one(message, profile):
+        time.sleep(delay)
+        with lock:
+            calls.append(('one', message))
+        return f"a:{message}"
+
+    def ask_batch(pairs):
+        time.sleep(delay)
+        with lock:
+            calls.append(('batch', [message for message, _ in pairs]))
+        if not answer_batch:
+            raise RuntimeError("backend down")
+        return [f"b:{message}" for message, _ in pairs]
+
+    return calls, ask_one, ask_batch
+
+
+def _submit_all(batcher, messages):
+    with ThreadPoolExecutor(max_workers=len(messages)) as pool:
+        return list(pool.map(batcher.submit, messages))
+
+
+# ==================================================================
+# =========================== BATCHING =============================
+# ==================================================================
+
+def test_lone_question_goes_alone():
+    calls, ask_one, ask_batch = _recorder()
+    batcher = AIBatcher(ask_one, ask_batch, window=0.2, idle_gap=0.05)
+    assert batcher.submit("x") == "a:x"
+    assert calls == [('one', 'x')]
+
+
+def test_burst_is_answered_with_one_batch():
+    calls, ask_one, ask_batch = _recorder()
+    batcher = AIBatcher(ask_one, ask_batch, window=0.3, idle_gap=0.2)
+    assert _submit_all(batcher, ["x", "y", "z"]) == ["b:x", "b:y", "b:z"]
+    assert [kind for kind, _ in calls] == ['batch']
+    assert sorted(calls[0][1]) == ["x", "y", "z"]
+    assert batcher.stats['batched_questions'] == 3
+
+
+def test_max_batch_one_never_batches_or_waits():
+    calls, ask_one, ask_batch = _recorder()
+    batcher = AIBatcher(ask_one, ask_batch, window=5, idle_gap=5, max_batch=1)
+    start = time.monotonic()
+    assert _submit_all(batcher, ["x", "y", "z"]) == ["a:x", "a:y", "a:z"]
+    assert time.monotonic() - start < 2
+    assert sorted(calls) == [('one', 'x'), ('one', 'y'), ('one', 'z')]
+
+
+def test_failed_batch_falls_back_to_single_calls():
+    calls, ask_one, ask_batch = _recorder(answer_batch=False)
+    batcher = AIBatcher(ask_one, ask_batch, window=0.3, idle_gap=0.2)
+    assert _submit_all(batcher, ["x", "y"]) == ["a:x", "a:y"]
+    assert calls[0][0] == 'batch' and sorted(calls[0][1]) == ["x", "y"]
+    assert sorted(calls[1:]) == [('one', 'x'), ('one', 'y')]
+
+
+# ==================================================================
+# =========================== DEADLINES ============================
+# ==================================================================
+
+def test_slow_failing_burst_still_answers_everyone():
+    # 16 questions, 2 slots, every batch call fails after a delay: waiting
+    # for a slot must not eat the per-call timeout
+    calls, ask_one, ask_batch = _recorder(answer_batch=False, delay=0.1)
+    batcher = AIBatcher(ask_one, ask_batch, window=0.2, idle_gap=0.1,
+                        max_batch=4, max_concurrency=2, request_timeout=0.5)
+    messages = [f"q{i}" for i in range(16)]
+    assert _submit_all(batcher, messages) == [f"a:{m}" for m in messages]
+
+
+def test_question_past_max_wait_is_not_sent():
+    calls, ask_one, ask_batch = _recorder(delay=0.3)
+    batcher = AIBatcher(ask_one, None, max_concurrency=1, request_timeout=1, max_wait=0.2)
+    answers = _submit_all(batcher, ["x", "y"])
+    # Whichever got the slot first is answered; the other expired waiting
+    assert answers.count(None) == 1
+    assert set(answers) - {None} <= {"a:x", "a:y"}
+    assert len(calls) == 1
+    assert batcher.stats['expired'] == 1
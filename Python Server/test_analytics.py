@@ -0,0 +1,89 @@
+"""
+Tests for analytics.py
+
+    python -m pytest -q
+"""
+import os
+
+import pytest
+
+from analytics import AnalyticsJob, MessageLog, compact_day, load_day, merge_days, rollup
+
+
+@pytest.fixture
+def history(tmp_path):
+    log = MessageLog(str(tmp_path))
+    log.record_inbound("01712345678", "predefined", "thank you", "en", 1.0)
+    log.record_inbound("01812345678", "knowledge", "agri", "bn", 2.0)
+    log.record_inbound("01812345678", "ai", "health", "en", 300.0)
+    log.record_inbound("01912345678", "rate_limited", None, "en")
+    log.record_outbound("01712345678", True, 900.0)
+    log.record_outbound("01812345678", True, 1100.0)
+    log.record_outbound("01812345678", False, None)
+    (raw,) = [name for name in os.listdir(tmp_path) if name.endswith('.jsonl')]
+    return tmp_path, raw[:-6]
+
+
+def _compact(history_dir, day):
+    npz = str(history_dir / (day + '.npz'))
+    compact_day(str(history_dir / (day + '.jsonl')), npz)
+    return load_day(npz)
+
+
+# ==================================================================
+# =========================== ROLLUP ===============================
+# ==================================================================
+
+def test_rollup_counts(history):
+    stats = rollup(_compact(*history))
+    assert stats['messages_in'] == 4
+    assert stats['replies_out'] == 3
+    assert stats['sources'] == {'predefined': 1, 'knowledge': 1, 'ai': 1, 'rate_limited': 1}
+    assert stats['languages'] == {'en': 3, 'bn': 1}
+    assert sum(stats['messages_by_hour']) == 4
+
+
+def test_rollup_cache_hit_rate_skips_control_outcomes(history):
+    # 2 of the 3 answered messages never reached the AI; rate_limited doesn't count
+    assert rollup(_compact(*history))['cache_hit_rate'] == round(2 / 3, 3)
+
+
+def test_rollup_intents_leave_out_blank_and_control(history):
+    intents = rollup(_compact(*history))['top_intents']
+    assert set(intents) == {'thank you', 'agri', 'health'}
+
+
+def test_rollup_delivery_and_latency(history):
+    stats = rollup(_compact(*history))
+    assert stats['delivery_by_operator'] == {
+        'Grameenphone': {'sent': 1, 'success_rate': 1.0},
+        'Robi': {'sent': 2, 'success_rate': 0.5},
+    }
+    assert stats['response_ms']['max'] == 1100.0
+    assert stats['build_ms']['p50'] == 2.0
+
+
+def test_compact_day_skips_torn_line(history):
+    history_dir, day = history
+    with open(history_dir / (day + '.jsonl'), 'a', encoding='utf-8') as f:
+        f.write('{"kind": "in", "ts"')
+    assert rollup(_compact(history_dir, day))['messages_in'] == 4
+
+
+def test_merge_days_shares_categories(history):
+    cols = _compact(*history)
+    merged = rollup(merge_days([cols, cols]))
+    assert merged['messages_in'] == 8
+    assert merged['languages'] == {'en': 6, 'bn': 2}
+
+
+# ==================================================================
+# =========================== JOB ==================================
+# ==================================================================
+
+def test_job_builds_day_and_overall_stats(history):
+    history_dir, day = history
+    stats = AnalyticsJob(str(history_dir)).run_once()
+    assert list(stats['days']) == [day]
+    assert stats['overall']['messages_in'] == 4
+    assert os.path.exists(history_dir / (day + '.npz'))
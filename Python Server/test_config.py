@@ -0,0 +1,104 @@
+"""
+Tests for config.py
+
+    python -m pytest -q
+"""
+import json
+
+import pytest
+
+from config import AppConfig, ConfigWatcher, ENV_VARS, load_config
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for var in ENV_VARS:
+        monkeypatch.delenv(var, raising=False)
+
+
+def _write(path, data):
+    path.write_text(json.dumps(data), encoding='utf-8')
+    return str(path)
+
+
+# ==================================================================
+# =========================== LOADING ==============================
+# ==================================================================
+
+def test_missing_file_gives_defaults(tmp_path):
+    assert load_config(str(tmp_path / "none.json")) == AppConfig()
+
+
+def test_file_then_env(tmp_path, monkeypatch):
+    path = _write(tmp_path / "c.json", {"ai": {"model": "from-file", "max_batch": 2},
+                                         "gsm": {"baud_rate": "57600"}})
+    monkeypatch.setenv("AICELL_MODEL", "from-env")
+    config = load_config(path)
+    assert config.ai.model == "from-env"
+    assert config.ai.max_batch == 2
+    assert config.gsm.baud_rate == 57600
+
+
+@pytest.mark.parametrize("section, values", [
+    ("gsm", {"cnmi_modes": "AT+CNMI=2,2,0,0,0"}),
+    ("gsm", {"flow_control": "sometimes"}),
+    ("gsm", {"baud_rate": True}),
+    ("gsm", {"baud_rate": 9600.5}),
+    ("ai", {"max_batch": 0}),
+    ("ai", {"model": 7}),
+])
+def test_bad_values_keep_the_default(tmp_path, section, values):
+    config = load_config(_write(tmp_path / "c.json", {section: values}))
+    assert config == AppConfig()
+
+
+def test_bad_env_value_keeps_the_default(monkeypatch):
+    monkeypatch.setenv("AICELL_LOG_LEVEL", "verbose")
+    assert load_config(None).logging.level == "INFO"
+    monkeypatch.setenv("AICELL_LOG_LEVEL", "debug")
+    assert load_config(None).logging.level == "DEBUG"
+
+
+def test_bad_value_on_reload_keeps_the_running_value(tmp_path):
+    running = load_config(_write(tmp_path / "c.json", {"ai": {"max_batch": 3}}))
+    new = load_config(_write(tmp_path / "c.json", {"ai": {"max_batch": "lots"}}), running=running)
+    assert new.ai.max_batch == 3
+    # A key removed from the file goes back to its default
+    new = load_config(_write(tmp_path / "c.json", {}), running=running)
+    assert new.ai.max_batch == AppConfig().ai.max_batch
+
+
+# ==================================================================
+# =========================== HOT RELOAD ===========================
+# ==================================================================
+
+def test_watcher_hands_over_the_new_config(tmp_path):
+    path = _write(tmp_path / "c.json", {"limits": {"max_replies_per_minute": 5}})
+    seen = []
+    watcher = ConfigWatcher(path, load_config(path), lambda old, new: seen.append((old, new)))
+    _write(tmp_path / "c.json", {"limits": {"max_replies_per_minute": 9}})
+    assert watcher.reload()
+    assert seen[0][0].limits.max_replies_per_minute == 5
+    assert watcher.config.limits.max_replies_per_minute == 9
+
+
+def test_watcher_keeps_config_on_broken_file(tmp_path):
+    path = _write(tmp_path / "c.json", {})
+    config = load_config(path)
+    watcher = ConfigWatcher(path, config, lambda old, new: None)
+    (tmp_path / "c.json").write_text('{"ai": ', encoding='utf-8')
+    assert not watcher.reload()
+    assert watcher.config is config
+
+
+def test_watcher_keeps_config_when_apply_fails(tmp_path):
+    path = _write(tmp_path / "c.json", {})
+    config = load_config(path)
+
+    def on_change(old, new):
+        raise RuntimeError("port busy")
+
+    watcher = ConfigWatcher(path, config, on_change)
+    _write(tmp_path / "c.json", {"ai": {"max_batch": 2}})
+    assert not watcher.reload()
+    assert watcher.config is config
@@ -0,0 +1,68 @@
+"""
+Tests for knowledge_base.py (against the shipped knowledge/ content)
+
+    python -m pytest -q
+"""
+import os
+import shutil
+
+import pytest
+
+from knowledge_base import KnowledgeBase, tokenize
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+@pytest.fixture(scope="module")
+def kb(tmp_path_factory):
+    kb_dir = tmp_path_factory.mktemp("knowledge")
+    for name in ("faq.csv", "general.md"):
+        shutil.copy(os.path.join(HERE, "knowledge", name), kb_dir)
+    return KnowledgeBase(str(kb_dir))
+
+
+@pytest.mark.parametrize("query, question", [
+    ("how much urea for rice", "How much urea for rice paddy?"),
+    ("this rice has blast disease", "How to control rice blast disease?"),
+    ("is there info about dengue", "What are the signs of dengue?"),
+    ("how to make ors", "How do I make ORS at home?"),
+    ("how do i stop aicell messages", "How do I stop AiCell messages?"),
+])
+def test_confident_matches(kb, query, question):
+    doc = kb.match(query)
+    assert doc is not None and doc['question'] == question
+
+
+@pytest.mark.parametrize("query", [
+    "thank you so much",
+    "hi",
+    "which fertilizer is best for rice",
+    "what time is it",
+    "",
+])
+def test_one_shared_word_is_not_a_match(kb, query):
+    assert kb.match(query) is None
+
+
+def test_tokenize_keeps_bangla_words_whole():
+    assert tokenize("ধান চাষ কিভাবে করব?") == ["ধান", "চাষ", "করব"]
+
+
+def test_refresh_picks_up_new_and_removed_files(tmp_path):
+    shutil.copy(os.path.join(HERE, "knowledge", "faq.csv"), tmp_path)
+    kb = KnowledgeBase(str(tmp_path))
+    entries = len(kb.docs)
+    assert kb.match("when to vaccinate cattle") is None
+
+    path = tmp_path / "livestock.csv"
+    path.write_text("question,answer,topic\n"
+                    "When to vaccinate cattle?,Vaccinate cattle against anthrax every year.,agri\n",
+                    encoding="utf-8")
+    assert kb.refresh() == 1
+    assert kb.match("when to vaccinate cattle")['topic'] == "agri"
+
+    path.unlink()
+    assert kb.refresh() == 1
+    assert kb.match("when to vaccinate cattle") is None
+    assert len(kb.docs) == entries
+    assert "vaccinate" not in kb.postings
@@ -0,0 +1,113 @@
+"""
+Tests for phone_numbers.py
+
+    python -m pytest -q
+"""
+import pytest
+
+from phone_numbers import (ParsedNumber, is_valid_number, get_operator,
+                           normalize_many, normalize_number, parse_number,
+                           unique_numbers)
+
+
+# ==================================================================
+# =========================== parse_number =========================
+# ==================================================================
+
+@pytest.mark.parametrize("raw", [
+    "+8801712345678",
+    "008801712345678",
+    "8801712345678",
+    "01712345678",
+    "1712345678",
+    "017-1234 5678",
+    "(017) 1234.5678",
+    '"+8801712345678"',
+])
+def test_bangladesh_mobile_spellings_share_one_key(raw):
+    assert parse_number(raw) == ParsedNumber("+8801712345678", "mobile", "BD", "Grameenphone")
+
+
+@pytest.mark.parametrize("raw, operator", [
+    ("01312345678", "Grameenphone"),
+    ("01412345678", "Banglalink"),
+    ("01912345678", "Banglalink"),
+    ("01512345678", "Teletalk"),
+    ("01612345678", "Robi"),
+    ("01812345678", "Robi"),
+])
+def test_bangladesh_operator_prefixes(raw, operator):
+    assert get_operator(raw) == operator
+
+
+def test_other_country_with_rules():
+    assert parse_number("+919876543210") == ParsedNumber("+919876543210", "mobile", "IN", None)
+    assert parse_number("+9779812345678") == ParsedNumber("+9779812345678", "mobile", "NP", None)
+    # National form for a non-default country
+    assert normalize_number("09876543210", country="IN") == "+919876543210"
+
+
+def test_country_with_rules_rejects_bad_mobile():
+    assert parse_number("+8801212345678").kind == "invalid"
+    assert parse_number("+91123").kind == "invalid"
+
+
+@pytest.mark.parametrize("raw, key", [
+    ("+14155551234", "+14155551234"),
+    ("+447911123456", "+447911123456"),
+    ("00447911123456", "+447911123456"),
+    ("+44 7911 123456", "+447911123456"),
+])
+def test_international_without_rules_passes_through(raw, key):
+    parsed = parse_number(raw)
+    assert parsed == ParsedNumber(key, "international", None, None)
+    assert is_valid_number(raw)
+
+
+@pytest.mark.parametrize("raw", ["+1234567", "+1234567890123456", "+0123456789"])
+def test_international_outside_e164_is_invalid(raw):
+    assert parse_number(raw).key is None
+
+
+@pytest.mark.parametrize("raw", ["121", "16216", "26969"])
+def test_short_codes(raw):
+    parsed = parse_number(raw)
+    assert parsed.kind == "short_code"
+    assert parsed.key == raw
+
+
+@pytest.mark.parametrize("raw", ["bKash", "GP"])
+def test_alphanumeric_sender_ids_cannot_be_replied_to(raw):
+    parsed = parse_number(raw)
+    assert parsed.kind == "alphanumeric"
+    assert parsed.key is None
+    assert not is_valid_number(raw)
+
+
+@pytest.mark.parametrize("raw", [None, "", "  ", "+", "12", "0171234", "+880-abc", "1234567890123"])
+def test_invalid(raw):
+    assert parse_number(raw).key is None
+
+
+# ==================================================================
+# =========================== BULK =================================
+# ==================================================================
+
+def test_normalize_many_keeps_order_and_length():
+    numbers = ["01712345678", "bKash", "+8801712345678", "121", "+14155551234", "01712345678"]
+    assert normalize_many(numbers) == [
+        "+8801712345678", None, "+8801712345678", "121", "+14155551234", "+8801712345678",
+    ]
+
+
+def test_normalize_many_empty():
+    assert normalize_many([]) == []
+
+
+def test_unique_numbers_first_seen_order_and_drops_invalid():
+    numbers = ["+14155551234", "01812345678", "bKash", "8801812345678", "+1 415 555 1234", "xx"]
+    assert unique_numbers(numbers) == ["+14155551234", "+8801812345678"]
+
+
+def test_unique_numbers_country_argument():
+    assert unique_numbers(["09876543210", "+919876543210"], country="IN") == ["+919876543210"]
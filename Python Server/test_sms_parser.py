@@ -0,0 +1,82 @@
+"""
+Tests for sms_parser.py
+
+    python -m pytest -q
+"""
+import pytest
+
+from sms_parser import ends_sms_body, parse_incoming_sms, parse_stored_sms
+
+HEADER = '+CMT: "01712345678","","24/01/01,10:00:00+24"'
+
+
+# ==================================================================
+# =========================== +CMT =================================
+# ==================================================================
+
+def test_single_line():
+    assert parse_incoming_sms(f'{HEADER}\r\nwhat is dengue\r\n') == ('+8801712345678', 'what is dengue', '')
+
+
+def test_multi_line_body_is_joined():
+    data = f'{HEADER}\r\nline one\r\nline two\r\nline three\r\n'
+    assert parse_incoming_sms(data)[1] == 'line one line two line three'
+
+
+@pytest.mark.parametrize("text", ["OK", "ERROR", "+1 thanks"])
+def test_first_line_is_always_body(text):
+    assert parse_incoming_sms(f'{HEADER}\n{text}\n')[1] == text
+
+
+def test_status_line_after_body_ends_it():
+    data = f'{HEADER}\nhello\nOK\n'
+    assert parse_incoming_sms(data)[1] == 'hello'
+
+
+def test_stops_at_next_notification():
+    data = f'{HEADER}\nfirst\n+CMT: "01812345678","",""\nsecond\n'
+    assert parse_incoming_sms(data) == ('+8801712345678', 'first', '')
+
+
+def test_empty_body_followed_by_notification():
+    data = f'{HEADER}\n+CMT: "01812345678","",""\nsecond\n'
+    assert parse_incoming_sms(data) == ('+8801712345678', '', '')
+
+
+def test_unknown_sender_kept_as_is():
+    assert parse_incoming_sms('+CMT: "bKash","",""\nhi\n')[0] == 'bKash'
+
+
+def test_no_notification():
+    assert parse_incoming_sms('OK\n') == (None, '', '')
+
+
+@pytest.mark.parametrize("line, body, ends", [
+    ("OK", [], False),
+    ("+CMGS: 3", [], False),
+    ("+CMT: x", [], True),
+    ("OK", ["hi"], True),
+    ("", ["hi"], True),
+    ("+CSQ: 20,0", ["hi"], True),
+    ("more text", ["hi"], False),
+])
+def test_ends_sms_body(line, body, ends):
+    assert ends_sms_body(line, body) is ends
+
+
+# ==================================================================
+# =========================== CMGL =================================
+# ==================================================================
+
+def test_stored_listing_keeps_only_received():
+    data = (
+        '+CMGL: 3,"REC UNREAD","+8801712345678","","24/01/01"\r\n'
+        'line a\r\nline b\r\n'
+        '+CMGL: 4,"STO UNSENT","","",""\r\ndraft\r\n'
+        '+CMGL: 5,"REC READ","01812345678","",""\r\nOK\r\n'
+        '\r\nOK\r\n'
+    )
+    assert parse_stored_sms(data) == [
+        ('3', '+8801712345678', 'line a line b'),
+        ('5', '+8801812345678', 'OK'),
+    ]